@@ -0,0 +1,224 @@
+import pandas as pd
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+
+class SnapshotNotFoundException(Exception):
+    pass
+
+
+def data_fingerprint(stocks_data):
+    """Hashes the price data the analysis is computed on, so that snapshots of different data never match
+
+    Args:
+        stocks_data (dict): Stock data by symbol, either DataFrames or AlphaVantage's (data, info) tuples
+
+    Returns:
+        string: Hex digest of the data
+    """
+    digest = hashlib.sha1()
+    for symbol in sorted(stocks_data):
+        data = stocks_data[symbol]
+        if isinstance(data, tuple):
+            data = data[0]
+        digest.update(symbol.encode())
+        digest.update(pd.util.hash_pandas_object(
+            data, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def as_of_date(stocks_data):
+    """Returns the date of the most recent price in the stock data
+
+    Args:
+        stocks_data (dict): Stock data by symbol, either DataFrames or AlphaVantage's (data, info) tuples
+
+    Returns:
+        string: The date, formatted as YYYY-MM-DD
+    """
+    dates = [(data[0] if isinstance(data, tuple) else data)["index"].max()
+             for data in stocks_data.values()]
+    return pd.Timestamp(max(dates)).strftime("%Y-%m-%d")
+
+
+class AnalysisStore:
+    INDEX_COLUMNS = ["SnapshotId", "Key", "Version", "Date", "Horizon",
+                     "ForecasterConfig", "DataFingerprint", "NumSymbols", "CreatedAt"]
+
+    def __init__(self, path="analysis_store"):
+        """Initializes a local store of stocks_analysis snapshots.
+        Every snapshot is a parquet file, while a small parquet index keeps the metadata,
+        so listing the snapshots never requires opening them.
+
+        Args:
+            path (string, optional): Directory of the store. Defaults to "analysis_store".
+        """
+        self.path = path
+        self.snapshots_path = os.path.join(path, "snapshots")
+        self.index_path = os.path.join(path, "index.parquet")
+        self.scenarios_path = os.path.join(path, "scenarios")
+        os.makedirs(self.snapshots_path, exist_ok=True)
+        os.makedirs(self.scenarios_path, exist_ok=True)
+
+    @staticmethod
+    def key(date, horizon, forecaster_config, fingerprint):
+        """Computes the key identifying the analysis of the given inputs
+
+        Args:
+            date (string): Date of the most recent price
+            horizon (int): Investment horizon in days
+            forecaster_config (dict): Parameters of the forecaster
+            fingerprint (string): Fingerprint of the price data
+
+        Returns:
+            string: Hex digest of the inputs
+        """
+        payload = json.dumps([str(date), int(horizon), forecaster_config,
+                              fingerprint], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def list_snapshots(self):
+        """Lists the stored snapshots, reading the index only
+
+        Returns:
+            pd.DataFrame: One row per snapshot
+        """
+        if not os.path.exists(self.index_path):
+            return pd.DataFrame(columns=self.INDEX_COLUMNS)
+        return pd.read_parquet(self.index_path)
+
+    def save(self, stocks_analysis, date, horizon, forecaster_config, fingerprint):
+        """Writes a new version of the snapshot for the given inputs
+
+        Args:
+            stocks_analysis (pd.DataFrame): The analysis to store
+            date (string): Date of the most recent price
+            horizon (int): Investment horizon in days
+            forecaster_config (dict): Parameters of the forecaster
+            fingerprint (string): Fingerprint of the price data
+
+        Returns:
+            string: Id of the new snapshot
+        """
+        index = self.list_snapshots()
+        key = self.key(date, horizon, forecaster_config, fingerprint)
+        version = int((index["Key"] == key).sum()) + 1
+        snapshot_id = f"{key}-v{version}"
+        stocks_analysis.reset_index(drop=True).to_parquet(
+            os.path.join(self.snapshots_path, f"{snapshot_id}.parquet"), index=False)
+        row = pd.DataFrame([{
+            "SnapshotId": snapshot_id,
+            "Key": key,
+            "Version": version,
+            "Date": str(date),
+            "Horizon": int(horizon),
+            "ForecasterConfig": json.dumps(forecaster_config, sort_keys=True, default=str),
+            "DataFingerprint": fingerprint,
+            "NumSymbols": len(stocks_analysis),
+            "CreatedAt": pd.Timestamp(time.time(), unit="s")
+        }], columns=self.INDEX_COLUMNS)
+        # The new index is written aside and swapped in, so a crash never leaves a broken index behind
+        temporary_fd, temporary_path = tempfile.mkstemp(
+            dir=self.path, suffix=".parquet")
+        os.close(temporary_fd)
+        try:
+            pd.concat([index, row], ignore_index=True).to_parquet(
+                temporary_path, index=False)
+            os.replace(temporary_path, self.index_path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        return snapshot_id
+
+    def read(self, snapshot_id):
+        """Reads a snapshot by id
+
+        Args:
+            snapshot_id (string): Id of the snapshot
+
+        Raises:
+            SnapshotNotFoundException: Raised when there's no snapshot with the given id.
+
+        Returns:
+            pd.DataFrame: The stored stocks_analysis
+        """
+        snapshot_path = os.path.join(
+            self.snapshots_path, f"{snapshot_id}.parquet")
+        if not os.path.exists(snapshot_path):
+            raise SnapshotNotFoundException(
+                f"There's no snapshot with id {snapshot_id}.")
+        return pd.read_parquet(snapshot_path)
+
+    def load(self, date, horizon, forecaster_config, fingerprint):
+        """Reads the latest version of the snapshot matching the given inputs
+
+        Args:
+            date (string): Date of the most recent price
+            horizon (int): Investment horizon in days
+            forecaster_config (dict): Parameters of the forecaster
+            fingerprint (string): Fingerprint of the price data
+
+        Returns:
+            pd.DataFrame: The stored stocks_analysis, or None if there's no matching snapshot
+        """
+        index = self.list_snapshots()
+        matches = index[index["Key"] == self.key(
+            date, horizon, forecaster_config, fingerprint)]
+        if len(matches) == 0:
+            return None
+        return self.read(matches.sort_values("Version")["SnapshotId"].iloc[-1])
+
+    def save_scenarios(self, scenarios, date, horizon, forecaster_config, fingerprint):
+        """Writes the return scenarios sampled from the forecaster for the given inputs
+
+        Args:
+            scenarios (pd.DataFrame): (scenarios, symbols) returns, one column per symbol
+            date (string): Date of the most recent price
+            horizon (int): Investment horizon in days
+            forecaster_config (dict): Parameters of the forecaster, including the sampling ones
+            fingerprint (string): Fingerprint of the price data
+        """
+        scenarios.to_parquet(os.path.join(self.scenarios_path,
+                                          f"{self.key(date, horizon, forecaster_config, fingerprint)}.parquet"), index=False)
+
+    def load_scenarios(self, date, horizon, forecaster_config, fingerprint):
+        """Reads the return scenarios sampled from the forecaster for the given inputs
+
+        Args:
+            date (string): Date of the most recent price
+            horizon (int): Investment horizon in days
+            forecaster_config (dict): Parameters of the forecaster, including the sampling ones
+            fingerprint (string): Fingerprint of the price data
+
+        Returns:
+            pd.DataFrame: The stored scenarios, one column per symbol, or None if there are none
+        """
+        scenarios_path = os.path.join(
+            self.scenarios_path, f"{self.key(date, horizon, forecaster_config, fingerprint)}.parquet")
+        if not os.path.exists(scenarios_path):
+            return None
+        return pd.read_parquet(scenarios_path)
+
+    def compare(self, first_id, second_id, columns=("Prediction", "Risk", "ror")):
+        """Compares two snapshots symbol by symbol
+
+        Args:
+            first_id (string): Id of the first snapshot
+            second_id (string): Id of the second snapshot
+            columns (tuple, optional): Columns to compare. Defaults to ("Prediction", "Risk", "ror").
+
+        Returns:
+            pd.DataFrame: Values of both snapshots and their difference, indexed by symbol
+        """
+        columns = list(columns)
+        first = self.read(first_id).set_index("Name")[columns]
+        second = self.read(second_id).set_index("Name")[columns]
+        comparison = first.join(second, how="outer",
+                                lsuffix="_first", rsuffix="_second")
+        for column in columns:
+            comparison[f"{column}_diff"] = comparison[f"{column}_second"] - \
+                comparison[f"{column}_first"]
+        return comparison
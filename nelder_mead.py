@@ -20,7 +20,7 @@ class Operations(Enum):
 
 
 class NelderMead:
-    def __init__(self, n, fn, sum_constraint=1, reflection_parameter=1, expansion_parameter=2, contraction_parameter=0.5, shrinkage_parameter=0.5, max_iterations=50, shift_coefficient=0.05, verbose=False, fix_result=True):
+    def __init__(self, n, fn, sum_constraint=1, reflection_parameter=1, expansion_parameter=2, contraction_parameter=0.5, shrinkage_parameter=0.5, max_iterations=50, shift_coefficient=0.05, verbose=False, fix_result=True, rng=None):
         """Initializes the optimizer    
 
         Args:
@@ -35,6 +35,7 @@ class NelderMead:
             shift_coefficient (float, optional): Coefficient of shift in the initial points. Defaults to 0.05.
             verbose (bool, optional): If True, the algorithm outputs the steps while they are made. Defaults to False.
             fix_result (bool, optional): Fixes the result to the sum constraint. Defaults to True.
+            rng (np.random.Generator or int, optional): Random generator, or seed, used for the initial point. Defaults to None, which creates an unseeded one.
         """
         self.reflection_parameter = reflection_parameter
         self.expansion_parameter = expansion_parameter
@@ -48,6 +49,8 @@ class NelderMead:
         self.shift_coefficient = shift_coefficient
         self.verbose = verbose
         self.fix_result = fix_result
+        self.rng = np.random.default_rng(rng)
+        self.evaluations = 0
 
     def initialize_simplex(self, x_1=None):
         """Initializes the first simplex to begin iterations
@@ -64,8 +67,9 @@ class NelderMead:
             if len(x_1) != self.n:
                 raise InitialPointShapeException(
                     f"Please enter an initial point having {self.n} dimensions.")
+            self.simplex_points[0] = x_1
         elif x_1 == None:  # If the user didn't provide a point
-            self.simplex_points[0] = np.random.rand(self.n)
+            self.simplex_points[0] = self.rng.random(self.n)
         else:  # If the user provided a point, and it is in the right shape
             self.simplex_points[0] = x_1
         # Then, we will generate all the other points
@@ -78,6 +82,18 @@ class NelderMead:
                 shift_coefficient_i * unit_vector_i
         print(f"Succesfully initialized simplex: {self.simplex_points}")
 
+    def evaluate(self, x):
+        """Evaluates the objective function, keeping count of the evaluated points
+
+        Args:
+            x (np.array): A point, or a matrix having a point per column
+
+        Returns:
+            The objective function value(s)
+        """
+        self.evaluations += 1 if x.ndim == 1 else x.shape[1]
+        return self.fn(x)
+
     def sort(self):
         """
         Fills self.simplex_points with the function values, then
@@ -88,7 +104,7 @@ class NelderMead:
         """
         # Calculate values of the function in all points of the simplex
         self.simplex_vals = np.array(
-            self.fn(self.simplex_points.transpose()))
+            self.evaluate(self.simplex_points.transpose()))
         sorted_indices = np.argsort(self.simplex_vals)
         self.min = self.simplex_vals[sorted_indices[0]]
         return sorted_indices[0], sorted_indices[-2], sorted_indices[-1]
@@ -108,7 +124,7 @@ class NelderMead:
         # Transformation: reflection
         x_reflected = centroid + \
             (self.reflection_parameter * (centroid-self.simplex_points[worst]))
-        y_reflected = self.fn(x_reflected)
+        y_reflected = self.evaluate(x_reflected)
         # If the new point is better than the second worst, but worse than the best, we can break to the next iteration
         if self.simplex_vals[best] < y_reflected <= self.simplex_vals[sec_worst]:
             # We don't want negative points
@@ -123,7 +139,7 @@ class NelderMead:
         elif y_reflected < self.simplex_vals[best]:
             x_expanded = centroid + self.expansion_parameter * \
                 (x_reflected-centroid)
-            y_expanded = self.fn(x_expanded)
+            y_expanded = self.evaluate(x_expanded)
             # We substitute the worst point with the better of the two
             if y_expanded < y_reflected:
                 self.simplex_points[worst] = x_expanded
@@ -144,7 +160,7 @@ class NelderMead:
         elif y_reflected > self.simplex_vals[sec_worst]:
             x_contracted = centroid + self.contraction_parameter * \
                 (self.simplex_points[worst] - centroid)
-            y_contracted = self.fn(x_contracted)
+            y_contracted = self.evaluate(x_contracted)
             if y_contracted < self.simplex_vals[worst]:
                 self.simplex_points[worst] = x_contracted
                 # Substitute negative values with 0
@@ -184,7 +200,7 @@ class NelderMead:
         if type(self.simplex_points) is not np.ndarray:
             raise NoSimplexDefinedException
         self.simplex_vals = np.array(
-            self.fn(self.simplex_points.transpose()))
+            self.evaluate(self.simplex_points.transpose()))
         std_dev = np.std(self.simplex_vals)
         i = 0
         while std_dev > target_stddev and i < self.max_iterations:
@@ -201,7 +217,7 @@ class NelderMead:
 
 if __name__ == '__main__':
     def fn(x): return ((x[0]+2*x[1]-7)**2 + (2*x[0]+x[1]-5)**2)
-    nm = NelderMead(2, fn, fix_result=False)
+    nm = NelderMead(2, fn, fix_result=False, rng=0)
     nm.initialize_simplex()
     print(nm.fit(0.00001))
     text = "as seen on WolframAlpha."
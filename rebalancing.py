@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+from nelder_mead import NelderMead
+from scenarios import normalize
+
+
+class UnknownSymbolsException(Exception):
+    pass
+
+
+def turnover(weights, initial_weights):
+    """Computes the traded weight of every asset at every rebalance
+
+    Args:
+        weights (np.array): (dates, assets) weights held after each rebalance
+        initial_weights (np.array): Weights held before the first rebalance
+
+    Returns:
+        np.array: (dates, assets) absolute weight changes
+    """
+    return np.abs(np.diff(weights, axis=0, prepend=np.asarray(initial_weights, dtype=float)[np.newaxis]))
+
+
+def transaction_costs(weights, initial_weights, costs):
+    """Computes the cost paid at every rebalance
+
+    Args:
+        weights (np.array): (dates, assets) weights held after each rebalance
+        initial_weights (np.array): Weights held before the first rebalance
+        costs (np.array): Proportional cost of trading each asset, either (assets,) or (dates, assets)
+
+    Returns:
+        np.array: Cost of each rebalance, as a fraction of the portfolio
+    """
+    return np.sum(turnover(weights, initial_weights) * costs, axis=1)
+
+
+def restrict(portfolio, tradable):
+    """Zeroes the weights of the assets that can't be held, then rescales to the sum constraint
+
+    Args:
+        portfolio (np.array): Portfolio, or (assets, portfolios) matrix
+        tradable (np.array): Boolean mask of the assets that can be held
+
+    Returns:
+        np.array: Non-negative weights summing up to 1, zero outside of the tradable assets
+    """
+    # Transposing lets the mask broadcast over a portfolio per column
+    return normalize((portfolio.T * tradable).T)
+
+
+def net_objective(expected_returns, previous_weights, costs, tradable=None):
+    """Builds the net-of-cost objective of a single rebalance
+
+    Args:
+        expected_returns (np.array): Expected return of each asset until the next rebalance
+        previous_weights (np.array): Weights held before the rebalance
+        costs (np.array): Proportional cost of trading each asset
+        tradable (np.array, optional): Boolean mask of the assets that can be held. Defaults to None, which means all of them.
+
+    Returns:
+        function: Objective to minimize, accepting a portfolio or a matrix having a portfolio per column
+    """
+    if tradable is None:
+        tradable = np.ones(len(expected_returns), dtype=bool)
+
+    def objective(portfolio):
+        portfolio = restrict(portfolio, tradable)
+        # Transposing lets the previous weights broadcast over a portfolio per column
+        traded = np.abs(portfolio.T - previous_weights).T
+        return np.dot(costs, traded) - np.dot(expected_returns, portfolio)
+    return objective
+
+
+def optimize_rebalancing(expected_returns, initial_weights, costs, tradable=None, warm_start=True, target_stddev=0.0001, **nelder_mead_parameters):
+    """Optimizes a sequence of rebalances, each one trading from the weights chosen at the previous one.
+    Every rebalance runs a Nelder-Mead of the same size, so the time per rebalance doesn't grow with the dates.
+
+    Args:
+        expected_returns (np.array): (dates, assets) expected return of each asset until the next rebalance
+        initial_weights (np.array): Weights held before the first rebalance
+        costs (np.array): Proportional cost of trading each asset, either (assets,) or (dates, assets)
+        tradable (np.array, optional): (dates, assets) boolean mask of the assets that can be held, the others are sold. Defaults to None, which means all of them.
+        warm_start (bool, optional): Starts each rebalance from the previous solution. Defaults to True.
+        target_stddev (float, optional): Target standard deviation of the simplex values. Defaults to 0.0001.
+        **nelder_mead_parameters: Passed through to NelderMead
+
+    Returns:
+        np.array: (dates, assets) weights held after each rebalance
+    """
+    expected_returns = np.asarray(expected_returns, dtype=float)
+    costs = np.broadcast_to(np.asarray(costs, dtype=float),
+                            expected_returns.shape)
+    tradable = np.broadcast_to(True if tradable is None else np.asarray(
+        tradable, dtype=bool), expected_returns.shape)
+    weights = np.empty(expected_returns.shape)
+    previous_weights = np.asarray(initial_weights, dtype=float)
+    for t in range(len(expected_returns)):
+        nm = NelderMead(expected_returns.shape[1], net_objective(
+            expected_returns[t], previous_weights, costs[t], tradable[t]), **nelder_mead_parameters)
+        nm.initialize_simplex(previous_weights.copy() if warm_start else None)
+        weights[t] = restrict(nm.fit(target_stddev), tradable[t])
+        previous_weights = weights[t]
+    return weights
+
+
+def rebalancing_report(weights, initial_weights, costs, expected_returns, dates=None):
+    """Summarizes a sequence of rebalances
+
+    Args:
+        weights (np.array): (dates, assets) weights held after each rebalance
+        initial_weights (np.array): Weights held before the first rebalance
+        costs (np.array): Proportional cost of trading each asset, either (assets,) or (dates, assets)
+        expected_returns (np.array): (dates, assets) expected return of each asset until the next rebalance
+        dates (list, optional): Rebalance dates, used as index. Defaults to None.
+
+    Returns:
+        pd.DataFrame: Turnover, cost, gross and net expected return of each rebalance
+    """
+    gross = np.sum(weights * expected_returns, axis=1)
+    cost = transaction_costs(weights, initial_weights, costs)
+    return pd.DataFrame({
+        "Turnover": np.sum(turnover(weights, initial_weights), axis=1),
+        "Cost": cost,
+        "GrossReturn": gross,
+        "NetReturn": gross - cost
+    }, index=dates)
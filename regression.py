@@ -0,0 +1,168 @@
+import pandas as pd
+import numpy as np
+import contextlib
+import json
+import os
+import sys
+import time
+from run_me import StockOptimizator
+
+
+class RegressionException(Exception):
+    pass
+
+
+MODES = ("optimize", "scenarios")
+
+
+def replay(historical_data, stocks_analysis, horizon, symbols, seed, mode="optimize", parameters=None):
+    """Runs the optimizer on recorded inputs, without re-running the analysis
+
+    Args:
+        historical_data (pd.DataFrame): Recorded price panel, in the all_stocks_5yr.csv format
+        stocks_analysis (pd.DataFrame): Recorded stocks_analysis
+        horizon (int): Investment horizon in days
+        symbols (list[string]): Stock symbols
+        seed (int): Seed of the random generator
+        mode (string, optional): Either "optimize" or "scenarios". Defaults to "optimize".
+        parameters (dict, optional): Passed through to the optimization method. Defaults to None.
+
+    Returns:
+        tuple: Weights, number of objective function evaluations and wall time in seconds
+    """
+    if mode not in MODES:
+        raise RegressionException(
+            f"Unknown mode {mode}, please use one of {', '.join(MODES)}.")
+    op = StockOptimizator(historical_data, horizon, symbols, seed=seed)
+    op.stocks_analysis = stocks_analysis.copy()
+    method = op.optimize if mode == "optimize" else op.optimize_scenarios
+    # The optimizers print at every iteration, we don't want the terminal in the timings
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        weights = method(**(parameters or {}))
+        wall_time = time.perf_counter() - start
+    return np.asarray(weights), op.nm.evaluations, wall_time
+
+
+def record_case(path, historical_data, stocks_analysis, horizon, symbols, seed=0, mode="optimize", parameters=None, repeat=3):
+    """Records the inputs of a run together with its baseline weights, evaluations and wall time
+
+    Args:
+        path (string): Directory of the case
+        historical_data (pd.DataFrame): Price panel, in the all_stocks_5yr.csv format
+        stocks_analysis (pd.DataFrame): The stocks_analysis to optimize on
+        horizon (int): Investment horizon in days
+        symbols (list[string]): Stock symbols
+        seed (int, optional): Seed of the random generator. Defaults to 0.
+        mode (string, optional): Either "optimize" or "scenarios". Defaults to "optimize".
+        parameters (dict, optional): Passed through to the optimization method. Defaults to None.
+        repeat (int, optional): Runs used to measure the wall time, the fastest one is kept. Defaults to 3.
+
+    Raises:
+        RegressionException: Raised when the runs don't agree with each other, i.e. the run isn't deterministic.
+
+    Returns:
+        dict: The recorded baseline
+    """
+    os.makedirs(path, exist_ok=True)
+    historical_data = historical_data[historical_data.Name.isin(symbols)]
+    historical_data.to_parquet(os.path.join(
+        path, "historical_data.parquet"), index=False)
+    stocks_analysis.to_parquet(os.path.join(
+        path, "stocks_analysis.parquet"), index=False)
+    # The baseline is computed on the inputs as they're read back, exactly like check_case will do
+    historical_data = pd.read_parquet(
+        os.path.join(path, "historical_data.parquet"))
+    stocks_analysis = pd.read_parquet(
+        os.path.join(path, "stocks_analysis.parquet"))
+    runs = [replay(historical_data, stocks_analysis, horizon, symbols, seed, mode, parameters)
+            for _ in range(repeat)]
+    for weights, evaluations, _ in runs[1:]:
+        if not np.array_equal(weights, runs[0][0]) or evaluations != runs[0][1]:
+            raise RegressionException(
+                f"{path}: the runs gave different results, a non-deterministic run can't be a baseline")
+    case = {
+        "horizon": horizon,
+        "symbols": symbols,
+        "seed": seed,
+        "mode": mode,
+        "parameters": parameters or {},
+        "weights": runs[0][0].tolist(),
+        "evaluations": runs[0][1],
+        "wall_time": min(run[2] for run in runs)
+    }
+    with open(os.path.join(path, "case.json"), "w") as case_file:
+        json.dump(case, case_file, indent=4)
+    return case
+
+
+def check_case(path, time_tolerance=1.5, time_slack=0.05, repeat=3):
+    """Replays a recorded case and compares it against its baseline
+
+    Args:
+        path (string): Directory of the case
+        time_tolerance (float, optional): Allowed ratio between the wall time and the baseline one. Defaults to 1.5.
+        time_slack (float, optional): Seconds always allowed over the baseline, so that very fast runs don't fail on noise. Defaults to 0.05.
+        repeat (int, optional): Runs used to measure the wall time, the fastest one is kept. Defaults to 3.
+
+    Raises:
+        RegressionException: Raised when the weights or the evaluations differ, or the run got too slow.
+
+    Returns:
+        dict: Evaluations and wall time of the replay, next to the baseline ones
+    """
+    with open(os.path.join(path, "case.json")) as case_file:
+        case = json.load(case_file)
+    historical_data = pd.read_parquet(
+        os.path.join(path, "historical_data.parquet"))
+    stocks_analysis = pd.read_parquet(
+        os.path.join(path, "stocks_analysis.parquet"))
+    runs = [replay(historical_data, stocks_analysis, case["horizon"], case["symbols"], case["seed"], case["mode"], case["parameters"])
+            for _ in range(repeat)]
+    for weights, evaluations, _ in runs:
+        if not np.array_equal(weights, np.asarray(case["weights"])):
+            raise RegressionException(
+                f"{path}: weights {weights.tolist()} differ from the baseline {case['weights']}")
+        if evaluations != case["evaluations"]:
+            raise RegressionException(
+                f"{path}: {evaluations} evaluations, the baseline needed {case['evaluations']}")
+    wall_time = min(run[2] for run in runs)
+    if wall_time > max(case["wall_time"] * time_tolerance, case["wall_time"] + time_slack):
+        raise RegressionException(
+            f"{path}: took {round(wall_time, 4)}s, the baseline took {round(case['wall_time'], 4)}s")
+    return {
+        "evaluations": runs[0][1],
+        "baseline_evaluations": case["evaluations"],
+        "wall_time": wall_time,
+        "baseline_wall_time": case["wall_time"]
+    }
+
+
+if __name__ == "__main__":
+    # python regression.py record <case> <horizon> <symbols> [mode] records a case from all_stocks_5yr.csv
+    # python regression.py [cases directory] checks all the recorded cases
+    if len(sys.argv) > 1 and sys.argv[1] == "record":
+        historical_data = pd.read_csv('all_stocks_5yr.csv')
+        horizon, symbols = int(sys.argv[3]), sys.argv[4].split(',')
+        op = StockOptimizator(historical_data, horizon, symbols)
+        op.analyse_stocks()
+        case = record_case(os.path.join("regression_cases", sys.argv[2]), historical_data, op.stocks_analysis,
+                           horizon, symbols, mode=sys.argv[5] if len(sys.argv) > 5 else "optimize")
+        print(
+            f"Recorded {sys.argv[2]}: {case['evaluations']} evaluations in {round(case['wall_time'], 4)}s")
+    else:
+        cases_path = sys.argv[1] if len(sys.argv) > 1 else "regression_cases"
+        if not os.path.isdir(cases_path) or len(os.listdir(cases_path)) == 0:
+            print(
+                f"There are no recorded cases in {cases_path}, please record one with: python regression.py record <case> <horizon> <symbols> [mode]")
+            sys.exit(1)
+        failures = 0
+        for case in sorted(os.listdir(cases_path)):
+            try:
+                result = check_case(os.path.join(cases_path, case))
+                print(
+                    f"✅ {case}: {result['evaluations']} evaluations, {round(result['wall_time'], 4)}s (baseline {round(result['baseline_wall_time'], 4)}s)")
+            except RegressionException as e:
+                failures += 1
+                print(f"❌ {e}")
+        sys.exit(1 if failures else 0)
@@ -1,17 +1,29 @@
 import pandas as pd
 import numpy as np
 from nelder_mead import NelderMead
+from sparse_portfolio import optimize_sparse, screen_top_k
+from analysis_store import AnalysisStore, as_of_date, data_fingerprint
+from scenarios import bootstrap_return_scenarios, cvar_objective, normalize, scenario_report
+from rebalancing import UnknownSymbolsException, optimize_rebalancing, rebalancing_report
 
 
 class StockOptimizator:
-    def __init__(self, historical_data=None, investment_horizon_days=None, symbols=None):
+    FORECASTER_CONFIG = {"forecaster": "last-close"}
+    ANALYSIS_COLUMNS = ["Name", "PredictionsFromDate", "PredictionsToDate",
+                        "OpenPrice", "Risk", "Prediction"]
+
+    def __init__(self, historical_data=None, investment_horizon_days=None, symbols=None, store=None, seed=None):
         """Initializes the StockOptimizator object
 
         Args:
             historical_data (pd.DataFrame, optional): Historical stock data. Defaults to None.
             investment_horizon_days (int, optional): Days of investment horizon. Defaults to None.
             symbols (list[string], optional): Stock symbols to insert in the portfolio. Defaults to None.
+            store (AnalysisStore, optional): Store to read and write stocks_analysis snapshots. Defaults to None.
+            seed (int, optional): Seed of the random generator used by the optimizers. Defaults to None.
         """
+        self.store = store
+        self.rng = np.random.default_rng(seed)
         # If the user didn't provide investment horizon and symbols, ask for 'em
         if investment_horizon_days == None or symbols == None:
             self.initialize_parameters()
@@ -19,8 +31,7 @@ class StockOptimizator:
             self.investment_horizon_days = investment_horizon_days
             self.symbols = symbols
         # Now, we fill up stocks_data with actual data
-        self.stocks_analysis = pd.DataFrame(columns=[
-            "Name", "PredictionsFromDate", "PredictionsToDate", "OpenPrice", "Risk", "Prediction"])
+        self.stocks_analysis = pd.DataFrame(columns=self.ANALYSIS_COLUMNS)
         historical_data = historical_data.dropna()
         self.historical_data = historical_data
         self.stocks_data = {}
@@ -68,9 +79,34 @@ class StockOptimizator:
             np.std(data["4. close"]))
         return data["4. close"].iloc[-1].item(), risk
 
-    def analyse_stocks(self):
-        """Creates a stocks_analysis DataFrame containing the informations needed by the optimization algorithm
+    def snapshot_inputs(self):
+        """Returns the inputs identifying the analysis snapshot of the current data
+
+        Returns:
+            tuple: Date, horizon, forecaster config and data fingerprint
         """
+        return (as_of_date(self.stocks_data), self.investment_horizon_days,
+                self.FORECASTER_CONFIG, data_fingerprint(self.stocks_data))
+
+    def analyse_stocks(self, refresh=False):
+        """Creates a stocks_analysis DataFrame containing the informations needed by the optimization algorithm.
+        If a store is available and it contains a snapshot of the same analysis, the snapshot is used instead.
+
+        Args:
+            refresh (bool, optional): Recomputes the analysis even if a snapshot exists, storing it as a new version. Defaults to False.
+        """
+        if self.store is not None:
+            snapshot_inputs = self.snapshot_inputs()
+            snapshot = None if refresh else self.store.load(*snapshot_inputs)
+            if snapshot is not None:
+                print("Using the stored analysis snapshot")
+                # Snapshots don't depend on the order of the symbols, while the optimizer pairs them by position
+                names = set(snapshot["Name"])
+                self.stocks_analysis = snapshot.set_index("Name").loc[[
+                    symbol for symbol in self.symbols if symbol in names]].reset_index()
+                return
+        # Analysing again must not pile the new rows on top of the previous ones
+        self.stocks_analysis = pd.DataFrame(columns=self.ANALYSIS_COLUMNS)
         for symbol, data in self.stocks_data.items():
             close_date = data["index"].iloc[-1]
             try:
@@ -94,6 +130,8 @@ class StockOptimizator:
         self.stocks_analysis["ror"] = (self.stocks_analysis["Prediction"] -
                                        self.stocks_analysis["OpenPrice"])/self.stocks_analysis["Risk"]
         self.stocks_analysis.sort_values("ror", ascending=False)
+        if self.store is not None:
+            self.store.save(self.stocks_analysis, *snapshot_inputs)
 
     def objective_function(self, portfolio):
         """The objective function to be optimized
@@ -109,7 +147,7 @@ class StockOptimizator:
     def optimize(self, reflection_parameter=1, expansion_parameter=2, contraction_parameter=0.1, shrinkage_parameter=0.5, max_iterations=25, shift_coefficient=0.05):
         print("Starting optimization...")
         self.nm = NelderMead(len(self.symbols), self.objective_function, 1, reflection_parameter, expansion_parameter,
-                             contraction_parameter, shrinkage_parameter, max_iterations, shift_coefficient)
+                             contraction_parameter, shrinkage_parameter, max_iterations, shift_coefficient, rng=self.rng)
         self.nm.initialize_simplex()
         results = self.nm.fit(0.0001)  # Stop when std_dev is 0.0001
         print("Optimization completed!")
@@ -121,10 +159,144 @@ class StockOptimizator:
                       * self.stocks_analysis["Prediction"].iloc[i])
         print(
             f"The predicted return for a 1000$ investment is {round(money, 2)}$")
+        return results
+
+    def optimize_sparse(self, top_k=20, max_assets=None, swap_iterations=0, min_weight=0.01, score="ror", max_iterations=25, risk_aversion=None, alpha=0.95, n_scenarios=5000):
+        """Optimizes the portfolio over the top_k symbols only, to cope with very large universes.
+        By default the objective is linear in the score, so this is a screen-then-truncate;
+        with a risk_aversion the candidates are optimized on CVaR over bootstrapped scenarios, and swaps can pay off.
+
+        Args:
+            top_k (int, optional): Number of symbols the optimizer works on. Defaults to 20.
+            max_assets (int, optional): Maximum number of symbols in the portfolio. Defaults to None, which means top_k.
+            swap_iterations (int, optional): Rounds of swapping symbols in and out of the candidates. Defaults to 0.
+            min_weight (float, optional): Weight under which a candidate gets swapped out. Defaults to 0.01.
+            score (string, optional): stocks_analysis column used to rank the symbols. Defaults to "ror".
+            max_iterations (int, optional): Limit of iterations in each optimization. Defaults to 25.
+
+            risk_aversion (float, optional): Weight of the CVaR against the expected return. Defaults to None, which means the linear objective.
+            alpha (float, optional): CVaR confidence level. Defaults to 0.95.
+            n_scenarios (int, optional): Number of bootstrapped return scenarios. Defaults to 5000.
+
+        Returns:
+            np.array: Weights of every symbol in self.symbols, zero for the ones left out
+        """
+        print("Starting sparse optimization...")
+        scores = self.stocks_analysis[score].to_numpy(dtype=float)
+        objective_factory = None
+        if risk_aversion is not None:
+            # Scenarios are only drawn for the symbols that can become candidates, not the whole universe
+            pool = screen_top_k(scores, top_k * (swap_iterations + 1))
+            scenarios = bootstrap_return_scenarios(self.close_prices(
+                list(self.stocks_analysis["Name"].iloc[pool])), self.investment_horizon_days, n_scenarios, self.rng)
+            columns = {asset: i for i, asset in enumerate(pool)}
+
+            def objective_factory(candidates):
+                return cvar_objective(scenarios[:, [columns[asset] for asset in candidates]], alpha, risk_aversion)
+        weights = optimize_sparse(scores, top_k, max_assets, swap_iterations, min_weight,
+                                  objective_factory=objective_factory, max_iterations=max_iterations, rng=self.rng)
+        # stocks_analysis skips the symbols without enough data, so we map back through the names
+        weights = pd.Series(weights, index=self.stocks_analysis["Name"]).reindex(
+            self.symbols, fill_value=0).to_numpy()
+        print("Optimization completed!")
+        for i in np.flatnonzero(weights):
+            print(
+                f"The stock {self.symbols[i]} should be {round(weights[i]*100,2)}% of your portfolio")
+        return weights
+
+    def close_prices(self, symbols=None):
+        """Builds the panel of closing prices
+
+        Args:
+            symbols (list[string], optional): Symbols to include. Defaults to None, which means self.symbols.
+
+        Returns:
+            pd.DataFrame: Closing prices, one column per symbol having data, indexed by date
+        """
+        return pd.DataFrame({symbol: self.stocks_data[symbol].set_index("index")["4. close"]
+                             for symbol in (self.symbols if symbols is None else symbols)}).dropna(axis=1, how="all")
+
+    def optimize_scenarios(self, n_scenarios=5000, alpha=0.95, risk_aversion=1, reflection_parameter=1, expansion_parameter=2, contraction_parameter=0.1, shrinkage_parameter=0.5, max_iterations=25, shift_coefficient=0.05):
+        """Optimizes the portfolio over Monte Carlo return scenarios, minimizing the CVaR minus the expected return
+
+        Args:
+            n_scenarios (int, optional): Number of return scenarios. Defaults to 5000.
+            alpha (float, optional): CVaR confidence level. Defaults to 0.95.
+            risk_aversion (float, optional): Weight of the CVaR against the expected return. Defaults to 1.
+
+        Returns:
+            np.array: Weights of every symbol in self.symbols
+        """
+        close_prices = self.close_prices()
+        # Symbols without any data are left out of the scenarios, and get no weight
+        self.scenario_symbols = list(close_prices.columns)
+        self.scenarios = bootstrap_return_scenarios(
+            close_prices, self.investment_horizon_days, n_scenarios, self.rng)
+        print("Starting scenario optimization...")
+        self.nm = NelderMead(len(self.scenario_symbols), cvar_objective(self.scenarios, alpha, risk_aversion), 1, reflection_parameter, expansion_parameter,
+                             contraction_parameter, shrinkage_parameter, max_iterations, shift_coefficient, rng=self.rng)
+        self.nm.initialize_simplex()
+        weights = normalize(self.nm.fit(0.0001))  # Stop when std_dev is 0.0001
+        print("Optimization completed!")
+        report = scenario_report(self.scenarios, weights, alpha)
+        results = pd.Series(weights, index=self.scenario_symbols).reindex(
+            self.symbols, fill_value=0).to_numpy()
+        for i in range(len(self.symbols)):
+            print(
+                f"The stock {self.symbols[i]} should be {round(results[i]*100,2)}% of your portfolio")
+        print(
+            f"Over {len(self.scenarios)} scenarios the expected return is {round(report['ExpectedReturn']*100, 2)}%, VaR {round(report['VaR']*100, 2)}% and CVaR {round(report['CVaR']*100, 2)}%")
+        return results
+
+    def optimize_rebalancing(self, current_weights, cost_model, analyses, warm_start=True, max_iterations=25):
+        """Optimizes a sequence of rebalances net of the transaction costs, starting from the current holdings
+
+        Args:
+            current_weights (dict or list): Weights currently held, by symbol or in the order of self.symbols
+            cost_model (float, dict or list): Proportional cost of trading, either for every symbol or by symbol
+            analyses (dict): stocks_analysis DataFrames by rebalance date, e.g. read from an AnalysisStore.
+                Symbols missing from a date's analysis can't be held at that date.
+            warm_start (bool, optional): Starts each rebalance from the previous solution. Defaults to True.
+            max_iterations (int, optional): Limit of iterations in each rebalance. Defaults to 25.
+
+        Raises:
+            UnknownSymbolsException: Raised when current_weights or cost_model refer to symbols which aren't in self.symbols.
+
+        Returns:
+            pd.DataFrame: Weights of every symbol after each rebalance, indexed by date
+        """
+        for name, values in [("current_weights", current_weights), ("cost_model", cost_model)]:
+            unknown = set(values) - set(self.symbols) if isinstance(values, dict) else set()
+            if unknown:
+                raise UnknownSymbolsException(
+                    f"The {name} refer to symbols which aren't in the portfolio: {', '.join(sorted(unknown))}.")
+        print("Starting rebalancing optimization...")
+        dates = sorted(analyses)
+        # Expected return until the next rebalance, one row per date and one column per symbol
+        expected_returns = pd.DataFrame({date: (analyses[date]["Prediction"] / analyses[date]["OpenPrice"] - 1).astype(float).set_axis(analyses[date]["Name"])
+                                         for date in dates}).T.reindex(columns=self.symbols)
+        # Symbols without a forecast at a date are sold, rather than held as zero-return assets
+        tradable = expected_returns.notna()
+        for date, row in tradable.iterrows():
+            if not row.all():
+                print(
+                    f"No analysis of {', '.join(row.index[~row])} on {date}, they will have no weight")
+        expected_returns = expected_returns.fillna(0)
+        initial_weights = pd.Series(
+            current_weights, index=self.symbols, dtype=float).fillna(0).to_numpy()
+        costs = pd.Series(cost_model, index=self.symbols,
+                          dtype=float).fillna(0).to_numpy()
+        weights = optimize_rebalancing(expected_returns.to_numpy(), initial_weights, costs, tradable.to_numpy(), warm_start,
+                                       max_iterations=max_iterations, rng=self.rng)
+        print("Optimization completed!")
+        print(rebalancing_report(weights, initial_weights,
+                                 costs, expected_returns.to_numpy(), dates))
+        return pd.DataFrame(weights, index=dates, columns=self.symbols)
 
 
 if __name__ == "__main__":
     historical_data = pd.read_csv('all_stocks_5yr.csv')
-    op = StockOptimizator(historical_data=historical_data)
+    op = StockOptimizator(historical_data=historical_data,
+                          store=AnalysisStore())
     op.analyse_stocks()
     op.optimize()
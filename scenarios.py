@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+
+
+class NotEnoughHistoryException(Exception):
+    pass
+
+
+def bootstrap_return_scenarios(close_prices, horizon, n_scenarios=5000, rng=None, min_days=2):
+    """Draws return scenarios over the horizon by bootstrapping the historical daily returns.
+    Whole days are resampled, so the correlation between the assets is preserved.
+
+    Args:
+        close_prices (pd.DataFrame): Closing prices, one column per asset, indexed by date
+        horizon (int): Investment horizon in days
+        n_scenarios (int, optional): Number of scenarios to draw. Defaults to 5000.
+        rng (np.random.Generator, optional): Random generator. Defaults to None, which creates a new one.
+        min_days (int, optional): Minimum number of shared days of returns. Defaults to 2.
+
+    Raises:
+        NotEnoughHistoryException: Raised when the assets share less than min_days days of returns.
+
+    Returns:
+        np.array: (scenarios, assets) array of returns over the horizon
+    """
+    rng = np.random.default_rng(rng)
+    if close_prices.shape[1] == 0:
+        raise NotEnoughHistoryException(
+            "None of the assets has any price to bootstrap.")
+    # Only the days in which every asset has been traded can be resampled
+    log_returns = np.log(close_prices.sort_index()).diff().iloc[1:]
+    available_days = log_returns.notna().sum()
+    log_returns = log_returns.dropna().to_numpy()
+    if len(log_returns) < min_days:
+        raise NotEnoughHistoryException(
+            f"The assets only share {len(log_returns)} days of returns, at least {min_days} are needed: {available_days.idxmin()} has the shortest history.")
+    if len(log_returns) < available_days.max():
+        print(
+            f"Only {len(log_returns)} of {available_days.max()} days of returns are shared by all the assets, the bootstrap is limited to them because of {available_days.idxmin()}")
+    cumulated = np.zeros((n_scenarios, log_returns.shape[1]))
+    # We loop over the days of the horizon, never over the scenarios
+    for _ in range(horizon):
+        cumulated += log_returns[rng.integers(
+            0, len(log_returns), n_scenarios)]
+    return np.expm1(cumulated)
+
+
+def normalize(portfolio, sum_constraint=1):
+    """Rescales one portfolio, or a matrix having a portfolio per column, to the sum constraint
+
+    Args:
+        portfolio (np.array): Portfolio, or (assets, portfolios) matrix
+        sum_constraint (float, optional): The desired sum of the weights. Defaults to 1.
+
+    Returns:
+        np.array: Non-negative weights summing up to sum_constraint
+    """
+    portfolio = np.clip(portfolio, 0, None)
+    total = np.sum(portfolio, axis=0)
+    return portfolio / np.where(total == 0, 1, total) * sum_constraint
+
+
+def portfolio_returns(scenarios, portfolio):
+    """Computes the return of the portfolios in every scenario
+
+    Args:
+        scenarios (np.array): (scenarios, assets) array of returns
+        portfolio (np.array): Portfolio, or (assets, portfolios) matrix
+
+    Returns:
+        np.array: (scenarios,) or (scenarios, portfolios) array of returns
+    """
+    return scenarios @ normalize(portfolio)
+
+
+def expected_return(returns):
+    """Expected return of the portfolios
+
+    Args:
+        returns (np.array): Output of portfolio_returns
+
+    Returns:
+        np.array: Expected return of each portfolio
+    """
+    return np.mean(returns, axis=0)
+
+
+def value_at_risk(returns, alpha=0.95):
+    """Value at Risk of the portfolios, as a positive loss
+
+    Args:
+        returns (np.array): Output of portfolio_returns
+        alpha (float, optional): Confidence level. Defaults to 0.95.
+
+    Returns:
+        np.array: VaR of each portfolio
+    """
+    return -np.quantile(returns, 1-alpha, axis=0)
+
+
+def conditional_value_at_risk(returns, alpha=0.95):
+    """Conditional Value at Risk (expected shortfall) of the portfolios, as a positive loss
+
+    Args:
+        returns (np.array): Output of portfolio_returns
+        alpha (float, optional): Confidence level. Defaults to 0.95.
+
+    Returns:
+        np.array: CVaR of each portfolio
+    """
+    tail = max(int(np.ceil(len(returns) * (1-alpha))), 1)
+    # partition only brings the worst scenarios on top, without sorting them all
+    worst = np.partition(returns, tail-1, axis=0)[:tail]
+    return -np.mean(worst, axis=0)
+
+
+def cvar_objective(scenarios, alpha=0.95, risk_aversion=1):
+    """Builds an objective trading off expected return and tail risk over all the scenarios
+
+    Args:
+        scenarios (np.array): (scenarios, assets) array of returns
+        alpha (float, optional): CVaR confidence level. Defaults to 0.95.
+        risk_aversion (float, optional): Weight of the CVaR against the expected return. Defaults to 1.
+
+    Returns:
+        function: Objective to minimize, accepting a portfolio or a matrix having a portfolio per column
+    """
+    def objective(portfolio):
+        returns = portfolio_returns(scenarios, portfolio)
+        return risk_aversion * conditional_value_at_risk(returns, alpha) - expected_return(returns)
+    return objective
+
+
+def scenario_report(scenarios, portfolio, alpha=0.95):
+    """Summarizes a portfolio over the scenarios
+
+    Args:
+        scenarios (np.array): (scenarios, assets) array of returns
+        portfolio (np.array): Portfolio
+        alpha (float, optional): Confidence level. Defaults to 0.95.
+
+    Returns:
+        pd.Series: Expected return, VaR and CVaR
+    """
+    returns = portfolio_returns(scenarios, portfolio)
+    return pd.Series({
+        "ExpectedReturn": expected_return(returns),
+        "VaR": value_at_risk(returns, alpha),
+        "CVaR": conditional_value_at_risk(returns, alpha)
+    })
@@ -0,0 +1,153 @@
+import numpy as np
+from nelder_mead import NelderMead
+
+
+class NoCandidatesException(Exception):
+    pass
+
+
+class InvalidCardinalityException(Exception):
+    pass
+
+
+def screen_top_k(scores, k):
+    """Ranks the whole universe at once and returns the indices of the k best scores.
+    Non-finite scores (e.g. a ror computed on zero risk) are never selected.
+
+    Args:
+        scores (np.array): Score of every asset in the universe (e.g. the ror column)
+        k (int): Number of candidates to keep
+
+    Returns:
+        np.array: Indices of the k best assets, sorted from best to worst
+    """
+    scores = np.asarray(scores, dtype=float)
+    valid = np.flatnonzero(np.isfinite(scores))
+    k = min(k, len(valid))
+    if k == 0:
+        return np.empty(0, dtype=int)
+    # argpartition is O(n), we only sort the k survivors
+    candidates = valid[np.argpartition(-scores[valid], k-1)[:k]]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def apply_cardinality(weights, max_assets, sum_constraint=1):
+    """Keeps only the max_assets biggest weights and rescales them to the sum constraint
+
+    Args:
+        weights (np.array): Portfolio weights
+        max_assets (int): Maximum number of non-zero weights
+        sum_constraint (float, optional): The desired sum of the weights. Defaults to 1.
+
+    Returns:
+        np.array: Sparse portfolio weights
+    """
+    weights = np.clip(weights, 0, None)
+    if max_assets is not None and np.count_nonzero(weights) > max_assets:
+        weights[np.argsort(weights)[:-max_assets]] = 0
+    total = np.sum(weights)
+    if total == 0:
+        return weights
+    return weights / total * sum_constraint
+
+
+def linear_objective(scores):
+    """Builds a vectorized version of the StockOptimizator objective function
+
+    Args:
+        scores (np.array): Score of every candidate
+
+    Returns:
+        function: Objective accepting a single portfolio or a matrix having a portfolio per column
+    """
+    scores = np.asarray(scores, dtype=float)
+
+    def objective(portfolio):
+        return -np.dot(scores, portfolio)
+    return objective
+
+
+def rank_start(scores):
+    """Builds a starting point for the simplex favouring the best ranked candidates
+
+    Args:
+        scores (np.array): Score of every candidate
+
+    Returns:
+        np.array: Weights decreasing with the rank of the candidates, summing up to 1
+    """
+    start = np.empty(len(scores))
+    start[np.argsort(-np.asarray(scores, dtype=float))] = np.arange(
+        len(scores), 0, -1)
+    return start / np.sum(start)
+
+
+def optimize_sparse(scores, top_k=20, max_assets=None, swap_iterations=0, min_weight=0.01, sum_constraint=1, target_stddev=0.0001, objective_factory=None, **nelder_mead_parameters):
+    """Optimizes a portfolio over a very large universe.
+    The universe is pre-screened on the scores and Nelder-Mead only runs over the top_k candidates,
+    starting from a point that favours the best ranked ones.
+    With a non-linear objective (e.g. cvar_objective), the candidates under min_weight can then be swapped out
+    with the next best ones from the ranking, keeping a swap only if it improves the objective.
+    The default objective is linear in the scores, so the top_k candidates are already the best possible ones:
+    in that case the sparse mode is a screen-then-truncate, and no swaps are performed.
+
+    Args:
+        scores (np.array): Score of every asset in the universe (e.g. the ror column)
+        top_k (int, optional): Number of candidates the optimizer works on. Defaults to 20.
+        max_assets (int, optional): Maximum number of assets in the portfolio. Defaults to None, which means top_k.
+        swap_iterations (int, optional): Rounds of swapping assets in and out of the candidates. Defaults to 0.
+        min_weight (float, optional): Weight under which a candidate gets swapped out. Defaults to 0.01.
+        sum_constraint (float, optional): The desired sum of the weights. Defaults to 1.
+        target_stddev (float, optional): Target standard deviation of the simplex values. Defaults to 0.0001.
+        objective_factory (function, optional): Builds the objective to minimize from the indices of the candidates. Defaults to None, which means linear_objective on the scores.
+        **nelder_mead_parameters: Passed through to NelderMead
+
+    Raises:
+        InvalidCardinalityException: Raised when top_k or max_assets are lower than 1.
+        NoCandidatesException: Raised when no asset has a finite score.
+
+    Returns:
+        np.array: Sparse weights over the whole universe, in the same order as scores
+    """
+    if top_k < 1 or (max_assets is not None and max_assets < 1):
+        raise InvalidCardinalityException(
+            f"top_k and max_assets must be at least 1, got {top_k} and {max_assets}.")
+    scores = np.asarray(scores, dtype=float)
+    candidates = screen_top_k(scores, top_k)
+    if len(candidates) == 0:
+        raise NoCandidatesException(
+            "None of the assets has a finite score, there's nothing to optimize.")
+    if objective_factory is None:
+        def objective_factory(candidates): return linear_objective(
+            scores[candidates])
+        swap_iterations = 0
+    # The replacements only get ranked if we're going to swap
+    reserve = np.empty(0, dtype=int)
+    if swap_iterations > 0:
+        remaining = scores.copy()
+        remaining[candidates] = np.nan
+        reserve = screen_top_k(remaining, top_k * (swap_iterations + 1))
+    next_in_line = 0
+    best_candidates, best_weights, best_value = None, None, np.inf
+    for _ in range(swap_iterations + 1):
+        objective = objective_factory(candidates)
+        nm = NelderMead(len(candidates), objective,
+                        sum_constraint, **nelder_mead_parameters)
+        nm.initialize_simplex(rank_start(scores[candidates]) * sum_constraint)
+        weights = apply_cardinality(
+            nm.fit(target_stddev), max_assets, sum_constraint)
+        value = objective(weights)
+        # A swap is only kept if it improved the objective, otherwise we go on from the best candidates
+        if value < best_value:
+            best_candidates, best_weights, best_value = candidates, weights, value
+        # Swap the best candidates that didn't make it with the next ones in the ranking
+        dropped = np.flatnonzero(best_weights < min_weight)
+        if len(dropped) == 0 or next_in_line >= len(reserve):
+            break
+        incoming = reserve[next_in_line:next_in_line+len(dropped)]
+        next_in_line += len(incoming)
+        candidates = best_candidates.copy()
+        candidates[dropped[:len(incoming)]] = incoming
+    sparse_weights = np.zeros(len(scores))
+    sparse_weights[best_candidates] = best_weights
+    return sparse_weights
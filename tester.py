@@ -6,6 +6,7 @@ from halo import Halo
 import os
 import time
 from nelder_mead import NelderMead
+from analysis_store import AnalysisStore, as_of_date, data_fingerprint
 from alpha_vantage.timeseries import TimeSeries
 from darts.models import TCNModel
 from darts import TimeSeries as DartsTS
@@ -13,12 +14,31 @@ from darts.utils.missing_values import fill_missing_values
 
 
 class StockOptimizator:
-    def __init__(self, api_key, investment_horizon_days=None, symbols=None):
+    TCN_PARAMETERS = {
+        "input_chunk_length": 50,
+        "output_chunk_length": 30,
+        "n_epochs": 400,
+        "dropout": 0.1,
+        "dilation_base": 2,
+        "weight_norm": True,
+        "kernel_size": 5,
+        "num_filters": 3,
+        "random_state": 0
+    }
+    FORECASTER_CONFIG = {"forecaster": "TCN", "history": 1000, **TCN_PARAMETERS}
+    ANALYSIS_COLUMNS = ["Name", "PredictionsFromDate", "PredictionsToDate",
+                        "OpenPrice", "Risk", "Prediction"]
+
+    def __init__(self, api_key, investment_horizon_days=None, symbols=None, store=None, seed=None):
         """Initializes the StockOptimizator object
 
         Args:
             api_key (string): AlphaVantage API key
+            store (AnalysisStore, optional): Store to read and write stocks_analysis snapshots. Defaults to None.
+            seed (int, optional): Seed of the random generator used by the optimizers. Defaults to None.
         """
+        self.store = store
+        self.rng = np.random.default_rng(seed)
         tprint("lp-money-machine")
         ts = TimeSeries(key=api_key, output_format='pandas',
                         indexing_type='integer')  #
@@ -47,8 +67,7 @@ class StockOptimizator:
             if i % 5 == 0:
                 print("Downloaded 5 stocks, sleeping for 60sec")
                 time.sleep(60)
-        self.stocks_analysis = pd.DataFrame(columns=[
-            "Name", "PredictionsFromDate", "PredictionsToDate", "OpenPrice", "Risk", "Prediction"])
+        self.stocks_analysis = pd.DataFrame(columns=self.ANALYSIS_COLUMNS)
         spinner.stop()
 
     def initialize_parameters(self):
@@ -126,24 +145,41 @@ class StockOptimizator:
         """
         series = DartsTS.from_dataframe(
             data.head(1000), 'index', "4. close", freq="B")
-        model_tcn = TCNModel(
-            input_chunk_length=50,
-            output_chunk_length=30,
-            n_epochs=400,
-            dropout=0.1,
-            dilation_base=2,
-            weight_norm=True,
-            kernel_size=5,
-            num_filters=3,
-            random_state=0
-        )
+        model_tcn = TCNModel(**self.TCN_PARAMETERS)
         model_tcn.fit(fill_missing_values(series))
         prediction_aarima = model_tcn.predict(days_from_now)
         risk = abs(
             np.std(prediction_aarima.values()))
         return prediction_aarima.values()[-1][0], risk
 
-    def analyse_stocks(self):
+    def snapshot_inputs(self):
+        """Returns the inputs identifying the analysis snapshot of the current data
+
+        Returns:
+            tuple: Date, horizon, forecaster config and data fingerprint
+        """
+        return (as_of_date(self.stocks_data), self.investment_horizon_days,
+                self.FORECASTER_CONFIG, data_fingerprint(self.stocks_data))
+
+    def analyse_stocks(self, refresh=False):
+        """Creates a stocks_analysis DataFrame containing the informations needed by the optimization algorithm.
+        If a store is available and it contains a snapshot of the same analysis, the snapshot is used instead.
+
+        Args:
+            refresh (bool, optional): Recomputes the analysis even if a snapshot exists, storing it as a new version. Defaults to False.
+        """
+        if self.store is not None:
+            snapshot_inputs = self.snapshot_inputs()
+            snapshot = None if refresh else self.store.load(*snapshot_inputs)
+            if snapshot is not None:
+                print("Using the stored analysis snapshot")
+                # Snapshots don't depend on the order of the symbols, while the optimizer pairs them by position
+                names = set(snapshot["Name"])
+                self.stocks_analysis = snapshot.set_index("Name").loc[[
+                    symbol for symbol in self.symbols if symbol in names]].reset_index()
+                return
+        # Analysing again must not pile the new rows on top of the previous ones
+        self.stocks_analysis = pd.DataFrame(columns=self.ANALYSIS_COLUMNS)
         spinner = Halo(
             text="Analysing the timeseries through Profet", spinner="moon")
         spinner.start()
@@ -171,6 +207,8 @@ class StockOptimizator:
         self.stocks_analysis["ror"] = (self.stocks_analysis["Prediction"] -
                                        self.stocks_analysis["OpenPrice"])/self.stocks_analysis["Risk"]
         self.stocks_analysis.sort_values("ror", ascending=False)
+        if self.store is not None:
+            self.store.save(self.stocks_analysis, *snapshot_inputs)
         spinner.stop()
 
     def objective_function(self, portfolio):
@@ -187,7 +225,7 @@ class StockOptimizator:
     def optimize(self, reflection_parameter=1, expansion_parameter=2, contraction_parameter=0.1, shrinkage_parameter=0.5, max_iterations=15, shift_coefficient=0.05):
         print("Starting optimization...")
         self.nm = NelderMead(len(self.symbols), self.objective_function, 1, reflection_parameter, expansion_parameter,
-                             contraction_parameter, shrinkage_parameter, max_iterations, shift_coefficient)
+                             contraction_parameter, shrinkage_parameter, max_iterations, shift_coefficient, rng=self.rng)
         self.nm.initialize_simplex()
         results = self.nm.fit(0.0001)  # Stop when std_dev is 0.0001
         print("Optimization completed!")
@@ -208,6 +246,6 @@ class StockOptimizator:
 
 
 if __name__ == "__main__":
-    op = StockOptimizator("", 20, )
+    op = StockOptimizator("", 20, store=AnalysisStore())
     op.analyse_stocks()
     op.optimize()